@@ -8,21 +8,63 @@ Input parameters:
 You can override this. For helping type --help
 """
 
-import concurrent.futures
+import asyncio
+import atexit
 import logging
 import re
-import uuid
+import sys
 
 from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from json import dumps
-from os import getenv, path, walk
-from subprocess import PIPE, STDOUT, Popen
-from typing import Optional
+from functools import cache
+from itertools import count
+from logging.handlers import QueueHandler, QueueListener
+from os import environ, getenv, path, scandir
+from queue import SimpleQueue
+from shutil import which
+from subprocess import PIPE, STDOUT
 
 
+import orjson
+
 from jinja2 import Environment, FileSystemLoader
 
+# Lock IDs are DynamoDB lock UUIDs, so match the exact 8-4-4-4-12 hex
+# shape; compiled once as a bytes pattern because the plan output
+# stays undecoded until format_message
+_LOCK_ID_RE = re.compile(
+    rb"^ *ID: *[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+# UTF-8 encoding of the box-drawing symbol '─'
+_BOX_LINE = b'\xe2\x94\x80'
+
+# Default message bounds of the terragrunt plan output, compiled once
+_MSG_START = re.compile(rb"^$")
+_MSG_END = re.compile(rb"^You can apply this plan.*$")
+
+# Per-process debug correlation IDs; a counter increment is far
+# cheaper than the 16 bytes of kernel randomness uuid4 needs
+_FUNC_ID_COUNTER = count(1)
+
+# Module path prefix that terragrunt run-all emits on every output line
+_MODULE_PREFIX_RE = re.compile(rb"^\[([^\]]+)\] ?(.*\n?)$")
+
+# Per-module status markers in the terraform plan output; run-all
+# reports only one combined exit code, so each module's status is
+# derived from its own demultiplexed output
+_NO_CHANGES_MARK = b"No changes."
+_ERROR_MARK = b"Error:"
+
+# Stream buffer per subprocess pipe; a bigger buffer means fewer
+# read wake-ups while draining verbose terragrunt plan outputs
+_STREAM_LIMIT = 2**20
+
+# Newest output lines kept per subprocess; bounds peak memory to
+# O(workers * _MAX_OUTPUT_LINES) instead of the full plan size
+_MAX_OUTPUT_LINES = 1000
+
 class JsonFormatter(logging.Formatter):
     """
     Formatter that outputs JSON strings after parsing the LogRecord.
@@ -39,6 +81,9 @@ class JsonFormatter(logging.Formatter):
                  msec_format: str = "%s.%03dZ"):
         #W0102: Dangerous default value {} as argument (dangerous-default-value)
         self.fmt_dict = fmt_dict if fmt_dict is not None else {"message": "message"}
+        # Memoised here so format() does not redo the lookups per record
+        self.fmt_items = tuple(self.fmt_dict.items())
+        self.uses_time = "asctime" in self.fmt_dict.values()
         self.default_time_format = time_format
         self.default_msec_format = msec_format
         logging.Formatter.__init__(self)
@@ -47,22 +92,24 @@ class JsonFormatter(logging.Formatter):
         """
         Overwritten to look for the attribute in the format dict values instead of the fmt string.
         """
-        return "asctime" in self.fmt_dict.values()
+        return self.uses_time
 
     def formatMessage(self, record) -> dict:
         """
         Overwritten to return a dictionary of the relevant LogRecord attributes instead of a string.
         KeyError is raised if an unknown attribute is provided in the fmt_dict.
         """
+        record_dict = record.__dict__
+        msg = record_dict["msg"]
         result_dict = {}
-        for fmt_key, fmt_val in self.fmt_dict.items():
-            if fmt_key == "message" and isinstance(record.__dict__["msg"], (list, dict)):
-                result_dict[fmt_key] = record.__dict__["msg"]
+        for fmt_key, fmt_val in self.fmt_items:
+            if fmt_key == "message" and isinstance(msg, (list, dict)):
+                result_dict[fmt_key] = msg
                 continue
-            result_dict[fmt_key] = record.__dict__[fmt_val]
+            result_dict[fmt_key] = record_dict[fmt_val]
         return result_dict
 
-    def format(self, record) -> str:
+    def format(self, record) -> bytes:
         """
         Mostly the same as the parent's class method, the difference being
         that a dict is manipulated and dumped as JSON instead of a string.
@@ -84,12 +131,40 @@ class JsonFormatter(logging.Formatter):
         if record.stack_info:
             message_dict["stack_info"] = self.formatStack(record.stack_info)
 
-        return dumps(message_dict, default=str, indent=2)
+        return orjson.dumps(message_dict, default=str)
+
+
+class BytesStreamHandler(logging.StreamHandler):
+    """
+    Handler writing the JSON bytes produced by JsonFormatter straight
+    to a buffered binary stream. Flushing is left to the buffer and to
+    logging.shutdown at interpreter exit, so records do not pay one
+    write syscall each.
+    """
+    terminator = b"\n"
+
+    def emit(self, record) -> None:
+        try:
+            self.stream.write(self.format(record))
+            self.stream.write(self.terminator)
+        #W0703: Catching too general exception Exception (broad-except)
+        except Exception:
+            self.handleError(record)
+
+
+class PassthroughQueueHandler(QueueHandler):
+    """
+    Queue handler enqueueing the record as-is. Formatting and the
+    write syscall happen on the listener thread, so logging callers
+    only ever pay a queue put.
+    """
+    def prepare(self, record):
+        return record
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-stream_handler=logging.StreamHandler()
+stream_handler=BytesStreamHandler(stream=sys.stderr.buffer)
 stream_handler.setFormatter(JsonFormatter({"level": "levelname",
                                            "message": "message",
                                            "loggerName": "name",
@@ -98,28 +173,32 @@ stream_handler.setFormatter(JsonFormatter({"level": "levelname",
                                            "threadName": "threadName",
                                            "threadID": "thread",
                                            "timestamp": "asctime"}))
-logger.addHandler(stream_handler)
-
-@dataclass
+_log_queue = SimpleQueue()
+logger.addHandler(PassthroughQueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, stream_handler)
+_log_listener.start()
+# Draining the queue before the stream flushes at shutdown
+atexit.register(_log_listener.stop)
+
+@dataclass(slots=True)
 class Diff:
     """
     Class for keeping diffs of terraform states
 
     state_path  -- Path to terragrunt files that have changes
-    output      -- The outputs from terragrunt command
+    output      -- The combined output from terragrunt command: raw
+                    bytes as captured, replaced by the list of decoded
+                    lines after format_message
     exit_status -- Terragrun process exit status
                     0 - Succeeded, diff is empty (no changes)
                     1 - Errored
                     2 - Succeeded, there is a diff
-    error       -- The errors from terragrunt command,
-                    default is None
     lock_id     -- The lock id of the terragrunt state,
                     default is None
     """
     state_path:     str
-    output:         str
+    output:         bytes | list
     exit_status:    int
-    error:          str = None
     lock_id:        str = None
 
 
@@ -135,71 +214,154 @@ class AWSTerragrunt:
 
     def __init__(self, aws_access_key: str, aws_secret_key:str,
                        aws_session_token: str) -> None:
-        self.__auth_envs  = (f"AWS_ACCESS_KEY_ID={aws_access_key} "
-                             f"AWS_SECRET_ACCESS_KEY={aws_secret_key} "
-                             f"AWS_SESSION_TOKEN={aws_session_token}")
+        # Unset credentials (None) must not reach the env mapping:
+        # execve only accepts strings. AWS_SESSION_TOKEN in particular
+        # is routinely absent for long-lived IAM keys
+        credentials = {"AWS_ACCESS_KEY_ID":     aws_access_key,
+                       "AWS_SECRET_ACCESS_KEY": aws_secret_key,
+                       "AWS_SESSION_TOKEN":     aws_session_token}
+        # Merged once; every subprocess reuses the same mapping.
+        # The TF_/CHECKPOINT_ variables keep terraform non-interactive
+        # and skip its version-checkpoint network call per run
+        self.__env = {**environ,
+                      **{key: value for key, value in credentials.items()
+                         if value is not None},
+                      "TF_INPUT":              "0",
+                      "TF_IN_AUTOMATION":      "1",
+                      "CHECKPOINT_DISABLE":    "1"}
 
     @staticmethod
+    @cache
     def validate_terragrunt() -> None:
         """
-        Checking of terragrunt to exist.
-        """
-        cmd = "terragrunt --version"
-        with Popen(cmd, shell=True, universal_newlines=True,
-                   stdout=PIPE, stderr=STDOUT) as proc_result:
-            proc_result.communicate()
+        Checking of terragrunt to exist, at most once per process.
 
-    def __run_proccess(self, cmd: str, state_path: str, func_uuid: str = None) -> tuple:
+        A $PATH lookup is enough; failing it means the tool cannot do
+        anything useful, so the run stops with a clear message.
         """
-        Running and returning output and error of process.
+        if which("terragrunt") is None:
+            raise SystemExit("terragrunt executable not found in PATH")
 
-        Keyword arguments:
-        cmd         -- running command
-        state_path  -- the root directory for command running
-        func_uuid   -- unique UID for a better debugging process
+    async def __run_proccess(self, cmd: list, state_path: str, func_id: str = None) -> tuple:
         """
-        logger.debug({"msg": "Running run_proccess function", "uuid": func_uuid})
-        with Popen(cmd, shell=True,  universal_newlines=True,
-                   stdout=PIPE, stderr=STDOUT, cwd=state_path) as proc_result:
-            output, error = proc_result.communicate()
-            return output, error, proc_result.returncode
-
-    def __get_lock_id(self, raw_output: str) -> Optional[str]:
-        """
-        Finding and returning lock_id from terraform output.
+        Running the process, streaming its output line-by-line in a
+        single pass, and returning output, found lock_id and exit status.
 
         Keyword arguments:
-        raw_output  -- raw output of terragrun plan command
+        cmd         -- running command as an argv list
+        state_path  -- the root directory for command running
+        func_id     -- unique ID for a better debugging process
         """
-        for line in raw_output.split(('\n')):
-            if re.match("^ *ID: *([0-9,a-z]*-){4}[0-9,a-z]*$", line):
-                return line[line.rfind(' ')+1:]
-        return None
-
-    def get_plan(self, state_path: str, func_uuid: str = None) -> Diff:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug({"msg": "Running run_proccess function", "id": func_id})
+        proc_result = await asyncio.create_subprocess_exec(
+            *cmd, stdout=PIPE, stderr=STDOUT, cwd=state_path,
+            env=self.__env, limit=_STREAM_LIMIT)
+        lines = deque(maxlen=_MAX_OUTPUT_LINES)
+        lock_id = None
+        async for line in proc_result.stdout:
+            # The box-drawing separators are pure noise; dropping them
+            # at capture time keeps them out of the ring buffer
+            if _BOX_LINE in line:
+                continue
+            lines.append(line)
+            # Cheap substring test filters almost every line before the regex
+            if lock_id is None and b"ID:" in line and _LOCK_ID_RE.match(line.rstrip()):
+                lock_id = line.rstrip().rpartition(b' ')[2].decode()
+        returncode = await proc_result.wait()
+        return b''.join(lines), lock_id, returncode
+
+    async def get_plan(self, state_path: str, func_id: str = None) -> Diff:
         """
         Running terragrunt plan and returning Diff object instance.
 
         Keyword arguments:
         state_path  -- the root directory for command running
-        func_uuid   -- the uuid for debugging purpose
+        func_id     -- the unique ID for debugging purpose
         """
-        func_uuid = func_uuid if func_uuid is not None else str(uuid.uuid4())
-        logger.debug({"msg": "Running get_plan function", "uuid": func_uuid})
-        cmd = f"{self.__auth_envs} terragrunt plan -no-color -detailed-exitcode"
-        output, error, returncode = self.__run_proccess(cmd, state_path, func_uuid)
+        # The ID is only a debug correlation value; skip building it
+        # and the payload dict entirely when debug logging is off
+        if logger.isEnabledFor(logging.DEBUG):
+            func_id = func_id if func_id is not None else str(next(_FUNC_ID_COUNTER))
+            logger.debug({"msg": "Running get_plan function", "id": func_id})
+        cmd = ["terragrunt", "plan", "-no-color", "-detailed-exitcode"]
+        output, lock_id, returncode = await self.__run_proccess(cmd, state_path, func_id)
         if returncode == 1:
             return Diff(state_path=state_path,
                         output=output,
                         exit_status=returncode,
-                        error=error,
-                        lock_id=self.__get_lock_id(output))
+                        lock_id=lock_id)
         return Diff(state_path=state_path,
                     output=output,
-                    exit_status=returncode,
-                    error=error)
+                    exit_status=returncode)
+
+    async def get_all_plans(self, root_dir: str, parallelism: int,
+                            func_id: str = None) -> list:
+        """
+        Running a single terragrunt run-all plan over the whole tree
+        and returning the list of per-module Diff object instances.
 
-    def force_unlock(self, state_path: str, lock_id: str, func_uuid: str = None) -> Diff:
+        One invocation amortises terragrunt startup, provider loading
+        and dependency-graph evaluation across all modules. Terragrunt
+        reports one combined exit status for the run, so each Diff's
+        exit_status is derived from its own demultiplexed output:
+        modules that errored report 1, modules whose plan came back
+        clean report 0, and only modules that actually show a plan
+        carry the run-wide code.
+
+        Keyword arguments:
+        root_dir     -- the root directory of the whole terragrunt tree
+        parallelism  -- a count of parallel terragrunt units
+        func_id      -- the unique ID for debugging purpose
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            func_id = func_id if func_id is not None else str(next(_FUNC_ID_COUNTER))
+            logger.debug({"msg": "Running get_all_plans function", "id": func_id})
+        cmd = ["terragrunt", "run-all", "plan", "-no-color", "-detailed-exitcode",
+               "--terragrunt-non-interactive",
+               f"--terragrunt-parallelism={parallelism}"]
+        root_dir = path.abspath(root_dir)
+        proc_result = await asyncio.create_subprocess_exec(
+            *cmd, stdout=PIPE, stderr=STDOUT, cwd=root_dir,
+            env=self.__env, limit=_STREAM_LIMIT)
+
+        # Demultiplexing the combined output by the [module-path] line
+        # prefixes during the streaming read; unprefixed lines belong
+        # to the last seen module. Each module gets its own ring
+        # buffer, so the capture bound applies per module and a
+        # verbose neighbour cannot push a module out of the window
+        outputs = {}
+        locks = {}
+        module_path = root_dir
+        async for line in proc_result.stdout:
+            if _BOX_LINE in line:
+                continue
+            matched = _MODULE_PREFIX_RE.match(line)
+            if matched:
+                module_path = matched[1].decode()
+                line = matched[2]
+            outputs.setdefault(module_path,
+                               deque(maxlen=_MAX_OUTPUT_LINES)).append(line)
+            if module_path not in locks and b"ID:" in line \
+                    and _LOCK_ID_RE.match(line.rstrip()):
+                locks[module_path] = line.rstrip().rpartition(b' ')[2].decode()
+        returncode = await proc_result.wait()
+        diffs = []
+        for module_path, lines in outputs.items():
+            output = b''.join(lines)
+            if _ERROR_MARK in output:
+                exit_status = 1
+            elif _NO_CHANGES_MARK in output:
+                exit_status = 0
+            else:
+                exit_status = returncode
+            diffs.append(Diff(state_path=module_path,
+                              output=output,
+                              exit_status=exit_status,
+                              lock_id=locks.get(module_path)))
+        return diffs
+
+    async def force_unlock(self, state_path: str, lock_id: str, func_id: str = None) -> Diff:
         """
         Trying to unlock the terragrunt state, rerunning the terragrunt plan
         command, and returning the Diff object instance.
@@ -207,59 +369,158 @@ class AWSTerragrunt:
         Keyword arguments:
         state_path  -- the root directory for command running
         lock_id     -- The ID of lock state
-        func_uuid   -- the uuid for debugging purpose
+        func_id     -- the unique ID for debugging purpose
         """
-        func_uuid = func_uuid if func_uuid is not None else str(uuid.uuid4())
-        logger.debug({"msg": "Running force_unlock function", "uuid": func_uuid})
-        cmd = f"{self.__auth_envs} terragrunt force-unlock -force {lock_id}"
-        self.__run_proccess(cmd, state_path, func_uuid)
-        return self.get_plan(state_path, func_uuid)
+        if logger.isEnabledFor(logging.DEBUG):
+            func_id = func_id if func_id is not None else str(next(_FUNC_ID_COUNTER))
+            logger.debug({"msg": "Running force_unlock function", "id": func_id})
+        cmd = ["terragrunt", "force-unlock", "-force", lock_id]
+        await self.__run_proccess(cmd, state_path, func_id)
+        return await self.get_plan(state_path, func_id)
 
 
-def get_dirs(root_dir: str, exclude_dirs: list = None) -> list:
+def get_dirs(root_dir: str, exclude_dirs: frozenset = frozenset(
+        {".terragrunt-cache", ".terraform", ".git"})) -> list:
     """
     Finding all directories, expecting excluded, to contain the terragrunt.hcl file
     and return the list of them.
 
+    .terraform and .git are pruned by default as well: they are never
+    valid module roots and are often the largest subtrees.
+
     Keyword arguments:
     root_dir     -- the root directory for command running
-    exclude_dirs -- the list of excluded directories,
-                    default is [".terragrunt-cache"]
+    exclude_dirs -- the set of excluded directory names,
+                    default is {".terragrunt-cache", ".terraform", ".git"}
     """
-    #W0102: Dangerous default value {} as argument (dangerous-default-value)
-    exclude_dirs = exclude_dirs if exclude_dirs is not None else [".terragrunt-cache"]
     result_list = []
-    for root, dirs, files in walk(path.abspath(root_dir)):
-        dirs[:] = [d for d in dirs if d not in exclude_dirs]
-        if "terragrunt.hcl" in files and not dirs:
-            result_list.append(root)
+    stack = [path.abspath(root_dir)]
+    while stack:
+        current_dir = stack.pop()
+        hcl_found = False
+        subdirs = []
+        # Unreadable directories are skipped, as os.walk used to do
+        try:
+            with scandir(current_dir) as entries:
+                for entry in entries:
+                    if entry.name == "terragrunt.hcl":
+                        hcl_found = True
+                    elif entry.is_dir(follow_symlinks=False) and entry.name not in exclude_dirs:
+                        subdirs.append(entry.path)
+        except OSError:
+            continue
+        if hcl_found and not subdirs:
+            result_list.append(current_dir)
+        stack.extend(subdirs)
     return result_list
 
-def format_message(message: list, msg_start: str = None, msg_end: str = None) -> list:
+def format_message(message: list, start_re=_MSG_START, end_re=_MSG_END) -> list:
     """
     Normalising and returning the output of the terragrunt plan command.
 
+    Only the kept lines are decoded from bytes; filtered lines never
+    pay the UTF-8 decode cost.
+
     Keyword arguments:
-    message     -- the terragrunt plan output message
-    msg_start   -- regular expression of beginning a new message
-    msg_end     -- regular expression of ending a new message
+    message     -- the terragrunt plan output message as bytes lines
+    start_re    -- compiled pattern of beginning a new message
+    end_re      -- compiled pattern of ending a new message
     """
-    first_line_flag = True
-    line_number = 0
-    index_start, index_end = 0, len(message)-3
+    result = []
+    started = False
     for line in message:
-        if msg_start is not None:
-            if re.match(msg_start, line) and first_line_flag:
-                index_start = line_number + 1
-                first_line_flag = False
-        # Truncation of the symbol '─'
-        if '\u2500' in line:
-            message[line_number] = '\u2500'*20
-        if msg_end is not None:
-            if re.match(msg_end, line):
-                index_end = line_number - 1
-        line_number+=1
-    return message[index_start:index_end]
+        # Everything before the start marker is preamble; when no
+        # marker ever appears (typical for error output), the fallback
+        # keeps the whole output from the top instead of dropping it
+        if not started and start_re.match(line):
+            started = True
+            result = []
+            continue
+        if end_re.match(line):
+            break
+        # Box-drawing noise is already filtered at capture time;
+        # the check keeps format_message safe on unfiltered input too
+        if _BOX_LINE in line:
+            continue
+        result.append(line.decode("utf-8", "replace"))
+    return result
+
+async def collect_diffs(aws_tg: AWSTerragrunt, state_paths: list, workers: int) -> list:
+    """
+    Running terragrunt plan for every state concurrently, unlocking the
+    locked states, and returning the list of Diff objects to fix.
+
+    Keyword arguments:
+    aws_tg      -- the AWSTerragrunt class instance
+    state_paths -- the list of directories with terragrunt.hcl
+    workers     -- a count of parallel tasks
+    """
+    diffs = []
+    loop = asyncio.get_running_loop()
+    # format_message is pure-Python CPU work; running it in a process
+    # pool keeps it off the event loop and out from under the GIL
+    cpu_pool = ProcessPoolExecutor()
+
+    async def normalise_output(result):
+        result.output = await loop.run_in_executor(
+            cpu_pool, format_message, result.output.splitlines())
+        diffs.append(result)
+
+    # Workers pull paths from a queue, so only O(workers) tasks exist
+    # at any moment instead of one future per directory created up front
+    plan_queue = asyncio.Queue()
+    for state_path in state_paths:
+        plan_queue.put_nowait(state_path)
+
+    async def plan_worker():
+        while True:
+            try:
+                state_path = plan_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            result = await aws_tg.get_plan(state_path)
+            # If the Diff object does contain not an empty lock ID
+            # field, unlock and re-plan right away instead of queueing
+            # the retry behind the rest of the plan wave
+            if result.lock_id is not None:
+                result = await aws_tg.force_unlock(result.state_path,
+                                                   result.lock_id)
+            # Normalising the Diff.output, if it has errors or diffs
+            # and appending to the result list
+            if result.exit_status != 0:
+                await normalise_output(result)
+
+    await asyncio.gather(*(plan_worker() for _ in range(workers)))
+    cpu_pool.shutdown()
+    return diffs
+
+async def collect_all_diffs(aws_tg: AWSTerragrunt, root_dir: str, workers: int) -> list:
+    """
+    Running one terragrunt run-all plan for the whole tree, unlocking
+    the locked states, and returning the list of Diff objects to fix.
+
+    Keyword arguments:
+    aws_tg      -- the AWSTerragrunt class instance
+    root_dir    -- the root directory of the whole terragrunt tree
+    workers     -- a count of parallel terragrunt units
+    """
+    diffs = []
+    locked = []
+    for result in await aws_tg.get_all_plans(root_dir, workers):
+        if result.lock_id is not None:
+            locked.append(result)
+        elif result.exit_status != 0:
+            result.output = format_message(result.output.splitlines())
+            diffs.append(result)
+
+    # Unlocking the locked states and re-collecting their plans
+    unlocks = (aws_tg.force_unlock(result.state_path, result.lock_id)
+               for result in locked)
+    for result in await asyncio.gather(*unlocks):
+        if result.exit_status != 0:
+            result.output = format_message(result.output.splitlines())
+            diffs.append(result)
+    return diffs
 
 def main():
     """ Main function of the tool """
@@ -268,7 +529,11 @@ def main():
     # Initialising and configuring of argparse
     parser = ArgumentParser(description='Terragrunt observability tool')
     parser.add_argument("-r", "--root",     help="the root directory of script",  default='.')
-    parser.add_argument("-w", "--workers",  help="a count of parallel thread",    default=30 )
+    parser.add_argument("-w", "--workers",  help="a count of parallel tasks",
+                        type=int, default=30)
+    parser.add_argument("-m", "--mode",     help="planning mode; run-all shares "
+                        "provider cache and dependency graph in one invocation",
+                        choices=["per-module", "run-all"], default="per-module")
     args = parser.parse_args()
 
     # Checking of the terragrunt exist
@@ -278,44 +543,29 @@ def main():
                            getenv("AWS_SECRET_ACCESS_KEY"),
                            getenv("AWS_SESSION_TOKEN"))
 
-    # Initialising of a thread pool
-    diffs = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
-        # Running get_plan method for all found directories
-        threads = [executor.submit(aws_tg.get_plan, path) for path in get_dirs(args.root)]
-        while threads:
-            for thread in concurrent.futures.as_completed(threads):
-                new_threads = None
-                # If the Diff object does contain not an empty lock ID field,
-                # try to unlock it
-                if thread.result().lock_id is not None:
-                    # Running the new thread
-                    new_threads = executor.submit(aws_tg.force_unlock,
-                                                  thread.result().state_path,
-                                                  thread.result().lock_id)
-                    threads.append(new_threads)
-
-                # Normalising the Diff.output, if it has errors or diffs
-                # and appending to the result list
-                if thread.result().exit_status != 0 and new_threads is None:
-                    thread.result().output = format_message(thread.result().output.split('\n'))
-                    diffs.append(thread.result())
-
-                # Removing the now-completed thread
-                threads.remove(thread)
+    # Running the plans on a single event loop; the subprocesses are
+    # the parallel unit. run-all plans the whole tree in one terragrunt
+    # invocation, per-module keeps one subprocess per directory
+    if args.mode == "run-all":
+        diffs = asyncio.run(collect_all_diffs(aws_tg, args.root, args.workers))
+    else:
+        diffs = asyncio.run(collect_diffs(aws_tg, get_dirs(args.root), args.workers))
 
     # temporary printing of the result of the tool.
-    count = 0
-    for i in sorted(diffs, key=lambda p: p.state_path, reverse=True):
-        logger.info({"path": i.state_path, "diff": i.output})
-        count += 1
-    logger.info('You need to fix %s states', count)
+    # Keying by path lets the sort compare plain strings instead of
+    # dereferencing an attribute per comparison
+    diffs_by_path = {diff.state_path: diff for diff in diffs}
+    for state_path in sorted(diffs_by_path, reverse=True):
+        logger.info({"path": state_path, "diff": diffs_by_path[state_path].output})
+    logger.info('You need to fix %s states', len(diffs_by_path))
 
     tool_path=path.realpath(path.dirname(__file__))
-    template = Environment(loader=FileSystemLoader(tool_path)).get_template("index.j2")
-    content = template.render(diffs=diffs)
-    with open(f"{tool_path}/report/index.html", mode="w", encoding="utf-8") as message:
-        message.write(content)
+    template = Environment(loader=FileSystemLoader(tool_path),
+                           auto_reload=False).get_template("index.j2")
+    # Streaming the report chunk by chunk instead of rendering
+    # the whole HTML into one string first
+    with open(f"{tool_path}/report/index.html", mode="wb") as report_file:
+        template.stream(diffs=diffs).dump(report_file, encoding="utf-8")
 
 if __name__ == '__main__':
     main()